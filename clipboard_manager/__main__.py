@@ -1,7 +1,34 @@
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+
 from clipboard_manager.app import ClipboardImageSaverApp
+from clipboard_manager.config import DEBUG_ENV_VAR, LOG_BACKUP_COUNT, LOG_FILE, LOG_MAX_BYTES
+
+
+def _configure_logging():
+    # Routine UI log lines are emitted at DEBUG, so they only reach the
+    # file/console when CLIPBOARD_MANAGER_DEBUG is set; warnings and errors
+    # always reach the file.
+    debug = bool(os.getenv(DEBUG_ENV_VAR))
+    logger = logging.getLogger("clipboard_manager")
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    file_handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
+        delay=True,
+    )
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(file_handler)
+    if debug:
+        logger.addHandler(logging.StreamHandler())
 
 
 def main():
+    _configure_logging()
     app = ClipboardImageSaverApp()
     app.protocol("WM_DELETE_WINDOW", app.on_close)
     app.mainloop()
@@ -9,4 +36,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -1,27 +1,61 @@
 from __future__ import annotations
 
-import json
+import collections
+import concurrent.futures
+import importlib.util
+import io
+import logging
 import os
 import queue
+import re
 import threading
-import time
 import tkinter as tk
 from pathlib import Path
 from tkinter import filedialog, messagebox, ttk
-
-from clipboard_manager.clipboard import get_clipboard_image, get_clipboard_signature
+from typing import TYPE_CHECKING
+
+from clipboard_manager.clipboard import (
+    ClipboardAccessError,
+    ClipboardWatcher,
+    dib_signature,
+    dib_to_bmp_header,
+    get_clipboard_dib,
+    get_clipboard_sequence,
+    get_clipboard_signature,
+    image_from_dib,
+)
 from clipboard_manager.config import (
     APP_NAME,
+    CLIPBOARD_MAX_RETRIES,
+    CLIPBOARD_RETRY_MS,
+    DEFAULT_SAVE_FORMAT,
     GOOGLE_SETTINGS_FILE,
     GoogleSyncSettings,
     HISTORY_FILE,
     LOG_POLL_MS,
     MAX_FOLDER_HISTORY,
+    MAX_LOG_LINES,
     MIN_WINDOW_SIZE,
+    PNG_COMPRESS_LEVEL,
     POLL_INTERVAL_SEC,
+    SAVE_FORMATS,
     WINDOW_GEOMETRY,
+    dump_json,
+    load_json,
+)
+
+if TYPE_CHECKING:
+    from clipboard_manager.google_sync import GoogleSheetSync
+
+logger = logging.getLogger("clipboard_manager")
+
+_IMG_RE = re.compile(r"img_(\d+)\.(?:png|bmp)$")
+
+# Checked without importing: the Google client stack is slow to import and
+# is only loaded once sync is actually started.
+_GOOGLE_SYNC_AVAILABLE = all(
+    importlib.util.find_spec(name) is not None for name in ("googleapiclient", "google_auth_oauthlib")
 )
-from clipboard_manager.google_sync import GoogleSheetSync
 
 
 class ClipboardImageSaverApp(tk.Tk):
@@ -34,53 +68,104 @@ class ClipboardImageSaverApp(tk.Tk):
         # State
         self.history_file = HISTORY_FILE
         self.save_folder = tk.StringVar(value="")
+        self.save_format = tk.StringVar(value=DEFAULT_SAVE_FORMAT)
         self.folder_history = self._load_folder_history()
+        self._last_saved_history = list(self.folder_history)
+        # History writes happen on a background thread; None asks it to exit
+        self._persist_queue: queue.Queue[list[str] | None] = queue.Queue()
+        self._persist_thread = threading.Thread(target=self._persist_worker, daemon=True)
+        self._persist_thread.start()
         self.is_running = False
-        self.worker_thread: threading.Thread | None = None
         self.stop_event = threading.Event()
-        self.last_image_bytes = None
+        self.clipboard_watcher: ClipboardWatcher | None = None
+        self._poll_after_id: str | None = None
+        self.last_image_hash: int | None = None
+        self.last_seq = 0
+        self._clipboard_retries = 0
+        self._next_img_index = 1
         self.log_queue: queue.Queue[tuple[str, str]] = queue.Queue()
         self.clipboard_lock = threading.Lock()
+        # Encoding runs here so the watcher goes straight back to the clipboard
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="cb-save")
+        # Uploads run one at a time in capture order (saves may finish out of
+        # order), so each image takes the next free sheet cell.
+        self._sync_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="cb-sync")
+        self._save_local = threading.local()
         self.google_settings_file = GOOGLE_SETTINGS_FILE
         self.google_sync_settings = GoogleSyncSettings.load(self.google_settings_file)
         self.google_sync: GoogleSheetSync | None = None
+        self._google_settings_win: tk.Toplevel | None = None
+        self._reload_google_settings_form = None
         self._init_google_sync_async()
 
         self._build_ui()
         self._poll_log_queue()
 
-    def _load_folder_history(self) -> list[str]:
+    def _load_folder_history(self) -> collections.OrderedDict[str, None]:
+        # Keys only, most recent first; used as a small LRU
         if not self.history_file.exists():
-            return []
+            return collections.OrderedDict()
         try:
-            with self.history_file.open("r", encoding="utf-8") as file:
-                data = json.load(file)
-                if isinstance(data, list):
-                    return data
-        except (json.JSONDecodeError, OSError):
+            data = load_json(self.history_file)
+            if isinstance(data, list):
+                return collections.OrderedDict.fromkeys(data)
+        except (ValueError, OSError):
             pass
-        return []
+        return collections.OrderedDict()
 
     def _save_folder_history(self):
-        self.history_file.parent.mkdir(parents=True, exist_ok=True)
-        with self.history_file.open("w", encoding="utf-8") as file:
-            json.dump(self.folder_history, file)
+        history = list(self.folder_history)
+        if history == self._last_saved_history:
+            return
+        self._last_saved_history = history
+        self._persist_queue.put(history)
+
+    def _persist_worker(self):
+        while True:
+            history = self._persist_queue.get()
+            stop = history is None
+            # Coalesce bursts: only the newest snapshot needs writing
+            while True:
+                try:
+                    item = self._persist_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    history = item
+            if history is not None:
+                try:
+                    # Atomic replace, so a crash never leaves a torn file
+                    dump_json(self.history_file, history)
+                except OSError as exc:
+                    self._warn(f"Could not save folder history: {exc}")
+            if stop:
+                return
 
     def _init_google_sync_async(self, settings: GoogleSyncSettings | None = None):
         cfg = settings or self.google_sync_settings
 
         def worker():
+            # Write out anything the old client still has queued before replacing it
+            self._flush_google_sync()
             if not cfg.enabled:
                 self.google_sync = None
                 self._log("Google Sheets sync disabled (toggle is off).")
                 return
             try:
-                sync = GoogleSheetSync(cfg)
+                from clipboard_manager.google_sync import GoogleSheetSync
+            except ImportError as exc:
+                self.google_sync = None
+                self._warn(f"Google Sheets sync unavailable: {exc}")
+                return
+            try:
+                sync = GoogleSheetSync(cfg, log=self._log)
                 self.google_sync = sync
                 self._log("Google Sheets sync enabled.")
             except Exception as exc:
                 self.google_sync = None
-                self._log(f"Google Sheets sync not started: {exc}")
+                self._warn(f"Google Sheets sync not started: {exc}")
 
         threading.Thread(target=worker, daemon=True).start()
 
@@ -89,11 +174,11 @@ class ClipboardImageSaverApp(tk.Tk):
         if folder:
             self.save_folder.set(folder)
             self._log(f"Folder chosen: {folder}")
-            if folder not in self.folder_history:
-                self.folder_history.insert(0, folder)
-                if len(self.folder_history) > MAX_FOLDER_HISTORY:
-                    self.folder_history.pop()
-                self._save_folder_history()
+            self.folder_history[folder] = None
+            self.folder_history.move_to_end(folder, last=False)
+            while len(self.folder_history) > MAX_FOLDER_HISTORY:
+                self.folder_history.popitem(last=True)
+            self._save_folder_history()
 
     def _build_ui(self):
         main = ttk.Frame(self, padding=12)
@@ -119,8 +204,15 @@ class ClipboardImageSaverApp(tk.Tk):
         self.stop_btn = ttk.Button(ctrl, text="Stop", command=self.stop, state="disabled")
         self.stop_btn.pack(side="left", padx=(8, 0))
 
+        ttk.Label(ctrl, text="Format:").pack(side="left", padx=(16, 0))
+        self.format_combo = ttk.Combobox(
+            ctrl, textvariable=self.save_format, values=SAVE_FORMATS, state="readonly", width=5
+        )
+        self.format_combo.pack(side="left", padx=(4, 0))
+
         ttk.Button(ctrl, text="Open folder", command=self.open_folder).pack(side="left", padx=(16, 0))
-        ttk.Button(ctrl, text="Google sync…", command=self._open_google_settings).pack(side="left", padx=(8, 0))
+        if _GOOGLE_SYNC_AVAILABLE:
+            ttk.Button(ctrl, text="Google sync…", command=self._open_google_settings).pack(side="left", padx=(8, 0))
 
         # Status
         self.status_var = tk.StringVar(value="Ready. Choose a folder and press Start.")
@@ -166,19 +258,35 @@ class ClipboardImageSaverApp(tk.Tk):
         if self.is_running:
             return
 
+        # Scan once; _make_filename then just bumps the counter
+        with os.scandir(folder) as entries:
+            self._next_img_index = 1 + max(
+                (int(m.group(1)) for entry in entries if (m := _IMG_RE.match(entry.name))),
+                default=0,
+            )
+
         self.is_running = True
         self.stop_event.clear()
-        self.last_image_bytes = get_clipboard_signature(self._log, self.clipboard_lock)
+        self.last_seq = get_clipboard_sequence()
+        self._clipboard_retries = 0
+        self.last_image_hash = get_clipboard_signature(self._warn, self.clipboard_lock)
 
         self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
         self.folder_entry.configure(state="disabled")
+        self.format_combo.configure(state="disabled")
 
         self.status_var.set("Running: watching clipboard…")
         self._log("=== START ===")
 
-        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.worker_thread.start()
+        # Changes are handled on the listener's own thread; there is no
+        # separate worker. Without a listener, poll from the Tk event loop.
+        save_format = self.save_format.get()
+        watcher = ClipboardWatcher(self._warn, lambda: self._handle_clipboard_change(folder, save_format, watcher))
+        self.clipboard_watcher = watcher
+        if not watcher.start():
+            self._warn(f"Clipboard listener unavailable; polling every {POLL_INTERVAL_SEC:g}s instead.")
+            self._poll_clipboard(folder, save_format)
 
     def stop(self):
         if not self.is_running:
@@ -186,62 +294,157 @@ class ClipboardImageSaverApp(tk.Tk):
 
         self.stop_event.set()
         self.is_running = False
+        self._stop_clipboard_watcher()
 
         self.start_btn.configure(state="normal")
         self.stop_btn.configure(state="disabled")
         self.folder_entry.configure(state="normal")
+        self.format_combo.configure(state="readonly")
 
         self.status_var.set("Stopped.")
         self._log("=== STOP ===")
+        self._sync_pool.submit(self._flush_google_sync)
 
-    def _worker_loop(self):
-        folder = self.save_folder.get().strip()
+    def _poll_clipboard(self, folder: str, save_format: str):
+        if self.stop_event.is_set():
+            return
+        self._handle_clipboard_change(folder, save_format)
+        self._poll_after_id = self.after(int(POLL_INTERVAL_SEC * 1000), self._poll_clipboard, folder, save_format)
 
-        while not self.stop_event.is_set():
-            img = get_clipboard_image(self._log, self.clipboard_lock)
-            if img is not None:
-                try:
-                    current_bytes = img.tobytes()
-                    if current_bytes != self.last_image_bytes:
-                        self.last_image_bytes = current_bytes
-                        filename = self._make_filename()
-                        path = os.path.join(folder, filename)
-                        img.save(path, "PNG")
-                        self._log(f"Saved: {path}")
-                        self._set_status(f"Saved: {filename}")
-                        self._sync_to_google_sheets(Path(path))
-                except Exception as exc:
-                    self._log(f"Save error: {exc}")
-                    self._set_status("Save error (see log).")
-
-            time.sleep(POLL_INTERVAL_SEC)
-
-    def _make_filename(self) -> str:
-        folder = self.save_folder.get().strip()
-        existing_files = [f for f in os.listdir(folder) if f.startswith("img_") and f.endswith(".png")]
-        if existing_files:
-            numbers = [int(f.split("_")[1].split(".")[0]) for f in existing_files if f.split("_")[1].split(".")[0].isdigit()]
-            next_number = max(numbers) + 1 if numbers else 1
-        else:
-            next_number = 1
-        return f"img_{next_number}.png"
+    def _handle_clipboard_change(self, folder: str, save_format: str, watcher: ClipboardWatcher | None = None):
+        if self.stop_event.is_set():
+            return
+        seq = get_clipboard_sequence()
+        if seq == self.last_seq:
+            return
+
+        try:
+            data = get_clipboard_dib(self.clipboard_lock)
+        except ClipboardAccessError as exc:
+            # Leave last_seq alone so this copy is read again: by the
+            # listener's retry timer, or on the next poll tick.
+            if self._clipboard_retries < CLIPBOARD_MAX_RETRIES:
+                self._clipboard_retries += 1
+                if self._clipboard_retries == 1:
+                    self._warn(f"{exc}; retrying.")
+                if watcher is not None:
+                    watcher.retry_later(CLIPBOARD_RETRY_MS)
+                return
+            self._log(f"{exc}; giving up on this clipboard change.", logging.ERROR)
+            data = None
+        self._clipboard_retries = 0
+        if data is not None:
+            try:
+                # Sequence numbers also change for same-content writes;
+                # compare raw DIB digests and only decode new images.
+                image_hash = dib_signature(data)
+                if image_hash != self.last_image_hash:
+                    self.last_image_hash = image_hash
+                    path = os.path.join(folder, self._make_filename(folder, save_format))
+                    # Decoding (if any) happens on the save pool, not here
+                    saved = self._io_pool.submit(self._save_image, data, path)
+                    self._sync_pool.submit(self._sync_after_save, saved, Path(path))
+            except Exception as exc:
+                self._log(f"Save error: {exc}", logging.ERROR)
+                self._set_status("Save error (see log).")
+        self.last_seq = seq
+
+    def _stop_clipboard_watcher(self):
+        if self.clipboard_watcher is not None:
+            self.clipboard_watcher.stop()
+            self.clipboard_watcher = None
+        if self._poll_after_id is not None:
+            self.after_cancel(self._poll_after_id)
+            self._poll_after_id = None
+
+    def _make_filename(self, folder: str, ext: str = "png") -> str:
+        # The counter is only rescanned on start(); step over names created
+        # behind our back since then rather than overwrite them.
+        while True:
+            n = self._next_img_index
+            self._next_img_index += 1
+            filename = f"img_{n}.{ext}"
+            if not os.path.exists(os.path.join(folder, filename)):
+                return filename
+
+    def _write_png(self, img, path: str):
+        # Each save thread keeps one encode buffer; rewinding instead of
+        # truncating keeps its capacity across images.
+        buf = getattr(self._save_local, "buf", None)
+        if buf is None:
+            buf = self._save_local.buf = io.BytesIO()
+        buf.seek(0)
+        img.save(buf, "PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=False)
+        size = buf.tell()
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            with buf.getbuffer() as data:
+                written = 0
+                while written < size:
+                    written += os.write(fd, data[written:size])
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _write_bmp(dib: bytes, path: str):
+        # The DIB already is the bitmap body; just prepend the file header
+        with open(path, "wb") as fh:
+            fh.write(dib_to_bmp_header(dib))
+            fh.write(dib)
+
+    def _save_image(self, dib: bytes, path: str) -> bool:
+        try:
+            if path.endswith(".bmp"):
+                self._write_bmp(dib, path)
+            else:
+                self._write_png(image_from_dib(dib), path)
+        except Exception as exc:
+            self._log(f"Save error: {exc}", logging.ERROR)
+            self._set_status("Save error (see log).")
+            return False
+        self._log(f"Saved: {path}")
+        self._set_status(f"Saved: {os.path.basename(path)}")
+        return True
+
+    def _sync_after_save(self, saved: concurrent.futures.Future[bool], image_path: Path):
+        if saved.result():
+            self._sync_to_google_sheets(image_path)
 
     def _sync_to_google_sheets(self, image_path: Path):
         if not self.google_sync:
             return
         try:
             result = self.google_sync.upload_and_update(image_path)
-            self._log(f"Uploaded to Sheets ({result.cell}) via {result.link}")
+            self._log(f"Uploaded to Drive; Sheets write queued for {result.cell} via {result.link}")
         except Exception as exc:
-            self._log(f"Google sync error: {exc}")
+            self._log(f"Google sync error: {exc}", logging.ERROR)
+
+    def _flush_google_sync(self):
+        if not self.google_sync:
+            return
+        try:
+            self.google_sync.flush()
+        except Exception as exc:
+            self._log(f"Google sync error: {exc}", logging.ERROR)
 
     def _open_google_settings(self):
         self._log("Opening Google sync settings window.")
+        win = self._google_settings_win
+        if win is not None and win.winfo_exists():
+            # Reuse the hidden dialog, refreshed from the current settings
+            self._reload_google_settings_form()
+            win.deiconify()
+            win.lift()
+            win.grab_set()
+            return
+
         win = tk.Toplevel(self)
         win.title("Google sync settings")
         win.geometry("460x360")
         win.minsize(440, 340)
         win.grab_set()
+        self._google_settings_win = win
 
         frame = ttk.Frame(win, padding=12)
         frame.pack(fill="both", expand=True)
@@ -322,6 +525,24 @@ class ClipboardImageSaverApp(tk.Tk):
 
         ttk.Separator(frame).pack(fill="x", pady=(12, 8))
 
+        def load_settings():
+            cfg = self.google_sync_settings
+            enabled_var.set(cfg.enabled)
+            auth_var.set(cfg.auth_mode)
+            cred_var.set(cfg.credentials_file)
+            client_secret_var.set(cfg.client_secret_file)
+            token_var.set(cfg.token_file)
+            sheet_id_var.set(cfg.spreadsheet_id)
+            sheet_name_var.set(cfg.sheet_name)
+            search_var.set(cfg.search_term)
+            drive_var.set(cfg.drive_folder_id or "")
+
+        self._reload_google_settings_form = load_settings
+
+        def close():
+            win.grab_release()
+            win.withdraw()
+
         def save_and_close():
             updated = GoogleSyncSettings(
                 enabled=enabled_var.get(),
@@ -334,11 +555,17 @@ class ClipboardImageSaverApp(tk.Tk):
                 search_term=search_var.get().strip() or "add",
                 drive_folder_id=drive_var.get().strip() or None,
             )
+            if updated == self.google_sync_settings and (self.google_sync is not None or not updated.enabled):
+                # Nothing changed and sync is in the requested state: keep the
+                # running client instead of rebuilding it. A failed start
+                # (e.g. missing credentials file) is retried on Save.
+                close()
+                return
             updated.save(self.google_settings_file)
             self.google_sync_settings = updated
             self._init_google_sync_async(updated)
             self._log(f"Google sync settings saved (enabled={updated.enabled}, mode={updated.auth_mode}).")
-            win.destroy()
+            close()
 
         def toggle_fields(*_):
             mode = auth_var.get()
@@ -357,38 +584,62 @@ class ClipboardImageSaverApp(tk.Tk):
         btns = ttk.Frame(frame, padding=(0, 0, 0, 0))
         btns.pack(side="bottom", fill="x", pady=(4, 0))
         ttk.Button(btns, text="Save", command=save_and_close).pack(side="right", padx=(0, 6))
-        ttk.Button(btns, text="Cancel", command=win.destroy).pack(side="right")
+        ttk.Button(btns, text="Cancel", command=close).pack(side="right")
+        win.protocol("WM_DELETE_WINDOW", close)
 
         toggle_fields()
 
-    def _log(self, msg: str):
-        print(msg)
+    def _log(self, msg: str, level: int = logging.DEBUG):
+        # Routine lines stay at DEBUG; failures are logged higher so the log
+        # file records them without CLIPBOARD_MANAGER_DEBUG.
+        logger.log(level, msg)
         self.log_queue.put(("log", msg))
 
+    def _warn(self, msg: str):
+        self._log(msg, logging.WARNING)
+
     def _set_status(self, msg: str):
-        print(msg)
+        logger.debug(msg)
         self.log_queue.put(("status", msg))
 
     def _poll_log_queue(self):
-        try:
-            while True:
+        # Drain everything queued since the last tick and touch the widget once
+        log_buf: list[str] = []
+        status_msg: str | None = None
+        while True:
+            try:
                 kind, msg = self.log_queue.get_nowait()
-                if kind == "log":
-                    self.log_text.configure(state="normal")
-                    self.log_text.insert("end", msg + "\n")
-                    self.log_text.see("end")
-                    self.log_text.configure(state="disabled")
-                elif kind == "status":
-                    if self.is_running:
-                        self.status_var.set(msg)
-        except queue.Empty:
-            pass
+            except queue.Empty:
+                break
+            if kind == "log":
+                log_buf.append(msg + "\n")
+            elif kind == "status":
+                status_msg = msg
+
+        if log_buf:
+            self.log_text.configure(state="normal")
+            self.log_text.insert("end", "".join(log_buf))
+            end_line = int(self.log_text.index("end-1c").split(".")[0])
+            if end_line > MAX_LOG_LINES:
+                self.log_text.delete("1.0", f"{end_line - MAX_LOG_LINES}.0")
+            self.log_text.see("end")
+            self.log_text.configure(state="disabled")
+        if status_msg is not None and self.is_running:
+            self.status_var.set(status_msg)
 
         self.after(LOG_POLL_MS, self._poll_log_queue)
 
     def on_close(self):
         self.stop_event.set()
+        self._stop_clipboard_watcher()
+        self._sync_pool.submit(self._flush_google_sync)
+        self._persist_queue.put(None)
         self.destroy()
+        # Let queued saves, uploads and the final Sheets flush finish instead
+        # of dropping captured images; the window is already gone by now.
+        self._io_pool.shutdown(wait=True)
+        self._sync_pool.shutdown(wait=True)
+        self._persist_thread.join()
 
     def show_folder_history(self):
         history_window = tk.Toplevel(self)
@@ -1,23 +1,55 @@
 from __future__ import annotations
 
+import ctypes
+import io
+import struct
 import threading
 from typing import Callable, Optional
 
+import win32api
 import win32clipboard
-from PIL import Image, ImageGrab
+import win32con
+import win32gui
+import xxhash
+from PIL import BmpImagePlugin, Image
 
 LogFn = Callable[[str], None]
 
+WM_CLIPBOARDUPDATE = 0x031D
+_RETRY_TIMER_ID = 1
+
+_BI_RGB = 0
+_BI_BITFIELDS = 3
+_BGRX_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF)
+
+# Direct user32 bindings for the calls made on every wakeup; pywin32 is kept
+# for the actual capture (OpenClipboard/GetClipboardData).
+_user32 = ctypes.WinDLL("user32", use_last_error=True)
+_is_format_available = _user32.IsClipboardFormatAvailable
+_is_format_available.argtypes = [ctypes.c_uint]
+_is_format_available.restype = ctypes.c_bool
+_get_seq = _user32.GetClipboardSequenceNumber
+_get_seq.argtypes = []
+_get_seq.restype = ctypes.c_uint
+_set_timer = _user32.SetTimer
+_set_timer.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_void_p]
+_set_timer.restype = ctypes.c_size_t
+_kill_timer = _user32.KillTimer
+_kill_timer.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+_kill_timer.restype = ctypes.c_bool
 
-class ClipboardContext:
-    def __init__(self, log: LogFn):
-        self._log = log
 
+class ClipboardAccessError(OSError):
+    """The clipboard has an image but could not be read (e.g. another app has it open)."""
+
+
+class ClipboardContext:
     def __enter__(self):
         try:
             win32clipboard.OpenClipboard()
-        except Exception as exc:  # pragma: no cover - UI logging path
-            self._log(f"Error opening clipboard: {exc}")
+        except Exception as exc:  # pragma: no cover - clipboard held elsewhere
+            # Nothing to close: the caller reports this once and retries
+            raise ClipboardAccessError(f"Error opening clipboard: {exc}") from exc
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         try:
@@ -27,32 +59,216 @@ class ClipboardContext:
             pass
 
 
-def get_clipboard_image(log: LogFn, lock: threading.Lock) -> Optional[Image.Image]:
+class ClipboardWatcher:
     """
-    Return a PIL.Image if the clipboard currently holds an image, else None.
-    Uses CF_DIB to capture screenshots/images from the Windows clipboard.
+    Calls `on_change` when the clipboard changes instead of polling it.
+    A message-only window registered with AddClipboardFormatListener is pumped
+    on a daemon thread, and `on_change` runs there for each WM_CLIPBOARDUPDATE.
+    """
+
+    def __init__(self, log: LogFn, on_change: Callable[[], None]):
+        self._log = log
+        self._on_change = on_change
+        self.listening = False
+        self._ready = threading.Event()
+        self._hwnd = None
+        self._stop_requested = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> bool:
+        """
+        Start the listener thread and return whether it registered.
+        Waits for the thread to report either way (window creation is quick),
+        so a failed start never leaves a listener running behind a fallback.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.listening
+
+    def retry_later(self, delay_ms: int):
+        """
+        Call `on_change` again after `delay_ms`, on the listener thread.
+        Must be called from that thread (i.e. from `on_change`); repeated calls
+        restart the same timer.
+        """
+        if self._hwnd:
+            _set_timer(self._hwnd, _RETRY_TIMER_ID, delay_ms, None)
+
+    def stop(self):
+        self._stop_requested = True
+        if self._hwnd:
+            win32gui.PostMessage(self._hwnd, win32con.WM_CLOSE, 0, 0)
+
+    def _run(self):
+        try:
+            hinst = win32api.GetModuleHandle(None)
+            wc = win32gui.WNDCLASS()
+            wc.lpfnWndProc = self._wnd_proc
+            wc.lpszClassName = f"ClipboardImageSaverWatcher-{id(self)}"
+            wc.hInstance = hinst
+            class_atom = win32gui.RegisterClass(wc)
+            hwnd = win32gui.CreateWindowEx(
+                0, class_atom, "", 0, 0, 0, 0, 0, win32con.HWND_MESSAGE, 0, hinst, None
+            )
+            if not _user32.AddClipboardFormatListener(hwnd):
+                error = ctypes.get_last_error()
+                win32gui.DestroyWindow(hwnd)
+                raise ctypes.WinError(error)
+        except Exception as exc:  # pragma: no cover - UI logging path
+            self._log(f"Clipboard listener not started: {exc}")
+            self._ready.set()
+            return
+
+        self._hwnd = hwnd
+        self.listening = True
+        self._ready.set()
+        if self._stop_requested:
+            win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
+        win32gui.PumpMessages()
+        self._hwnd = None
+        self.listening = False
+        win32gui.UnregisterClass(class_atom, hinst)
+
+    def _wnd_proc(self, hwnd, msg, wparam, lparam):
+        if msg == win32con.WM_TIMER and wparam == _RETRY_TIMER_ID:
+            _kill_timer(hwnd, _RETRY_TIMER_ID)
+            msg = WM_CLIPBOARDUPDATE
+        if msg == WM_CLIPBOARDUPDATE:
+            try:
+                self._on_change()
+            except Exception as exc:  # pragma: no cover - UI logging path
+                self._log(f"Clipboard handler error: {exc}")
+            return 0
+        if msg == win32con.WM_CLOSE:
+            _user32.RemoveClipboardFormatListener(hwnd)
+            win32gui.DestroyWindow(hwnd)
+            return 0
+        if msg == win32con.WM_DESTROY:
+            win32gui.PostQuitMessage(0)
+            return 0
+        return win32gui.DefWindowProc(hwnd, msg, wparam, lparam)
+
+
+def get_clipboard_sequence() -> int:
+    """
+    Return the Windows clipboard sequence number.
+    The OS bumps it on every clipboard write, so it is a cheap change gate;
+    no OpenClipboard is needed.
+    """
+    return _get_seq()
+
+
+def dib_to_bmp_header(data: bytes) -> bytes:
+    """
+    Return the 14-byte BITMAPFILEHEADER that turns a CF_DIB payload into a
+    .bmp file when written in front of it.
+    """
+    header_size, _, _, _, bpp, compression, _, _, _, clr_used, _ = struct.unpack_from("<IiiHHIIiiII", data)
+    offset = header_size
+    if compression == _BI_BITFIELDS and header_size == 40:
+        offset += 12
+    if clr_used:
+        offset += clr_used * 4
+    elif bpp <= 8:
+        offset += (1 << bpp) * 4
+    return b"BM" + struct.pack("<IHHI", 14 + len(data), 0, 0, 14 + offset)
+
+
+def _image_from_dib(data: bytes) -> Optional[Image.Image]:
     """
+    Build an image straight from a CF_DIB payload, skipping the BMP decoder.
+    Only handles the uncompressed 24/32-bit layouts screenshots use; returns
+    None for anything else.
+    """
+    if len(data) < 40:
+        return None
+    header_size, width, height, _, bpp, compression, _, _, _, clr_used, _ = struct.unpack_from("<IiiHHIIiiII", data)
+    if header_size != 40 or bpp not in (24, 32) or width <= 0 or height == 0:
+        return None
+
+    offset = header_size + clr_used * 4
+    if compression == _BI_BITFIELDS:
+        if bpp != 32 or struct.unpack_from("<III", data, header_size) != _BGRX_MASKS:
+            return None
+        offset += 12
+    elif compression != _BI_RGB:
+        return None
+
+    rows = abs(height)
+    stride = (width * bpp + 31) // 32 * 4
+    if len(data) < offset + stride * rows:
+        return None
+    rawmode = "BGR" if bpp == 24 else "BGRX"
+    # Positive height means the rows are stored bottom-up
+    orientation = -1 if height > 0 else 1
+    return Image.frombuffer("RGB", (width, rows), memoryview(data)[offset:], "raw", rawmode, stride, orientation)
+
+
+def get_clipboard_dib(lock: threading.Lock) -> Optional[bytes]:
+    """
+    Return the raw CF_DIB payload if the clipboard holds an image, else None.
+    Raises ClipboardAccessError if there is an image but it could not be read.
+    """
+    # IsClipboardFormatAvailable does not need the clipboard open, so skip
+    # the system-wide OpenClipboard lock when there is no image at all.
+    if not _is_format_available(win32clipboard.CF_DIB):
+        return None
     try:
-        with lock, ClipboardContext(log):
-            if win32clipboard.IsClipboardFormatAvailable(win32clipboard.CF_DIB):
-                img = ImageGrab.grabclipboard()
-                if hasattr(img, "save"):
-                    return img  # type: ignore[return-value]
+        # GetClipboardData copies the payload, so only the fetch needs the
+        # clipboard; decoding happens after it is released.
+        with lock, ClipboardContext():
+            return win32clipboard.GetClipboardData(win32clipboard.CF_DIB)
+    except ClipboardAccessError:
+        raise
     except Exception as exc:  # pragma: no cover - UI logging path
-        log(f"Clipboard access error: {exc}")
+        raise ClipboardAccessError(f"Clipboard access error: {exc}") from exc
+
+
+def _read_clipboard_dib(log: LogFn, lock: threading.Lock) -> Optional[bytes]:
+    try:
+        return get_clipboard_dib(lock)
+    except ClipboardAccessError as exc:  # pragma: no cover - UI logging path
+        log(str(exc))
         return None
 
-    return None
 
+def image_from_dib(data: bytes) -> Image.Image:
+    """Decode a CF_DIB payload into a PIL.Image."""
+    img = _image_from_dib(data)
+    if img is None:
+        # Unusual header: let Pillow's DIB reader handle it
+        img = BmpImagePlugin.DibImageFile(io.BytesIO(data))
+    return img
 
-def get_clipboard_signature(log: LogFn, lock: threading.Lock) -> Optional[bytes]:
-    """Return a byte signature of the current clipboard image (or None)."""
-    image = get_clipboard_image(log, lock)
-    if image is None:
+
+def get_clipboard_image(log: LogFn, lock: threading.Lock) -> Optional[Image.Image]:
+    """
+    Return a PIL.Image if the clipboard currently holds an image, else None.
+    Uses CF_DIB to capture screenshots/images from the Windows clipboard.
+    """
+    data = _read_clipboard_dib(log, lock)
+    if data is None:
         return None
 
     try:
-        return image.tobytes()
-    except Exception:
+        return image_from_dib(data)
+    except Exception as exc:  # pragma: no cover - UI logging path
+        log(f"Clipboard image decode error: {exc}")
         return None
 
+
+def dib_signature(data: bytes) -> int:
+    """
+    Return a 64-bit xxh3 fingerprint of a CF_DIB payload as an int.
+    Hashing the raw bytes avoids decoding unchanged images.
+    """
+    return xxhash.xxh3_64_intdigest(data)
+
+
+def get_clipboard_signature(log: LogFn, lock: threading.Lock) -> Optional[int]:
+    """Return a fingerprint of the current clipboard image (or None)."""
+    data = _read_clipboard_dib(log, lock)
+    if data is None:
+        return None
+    return dib_signature(data)
@@ -1,22 +1,68 @@
-import json
+import functools
 import os
 from pathlib import Path
 
 from dataclasses import dataclass, field
 
+import orjson
+
 APP_NAME = "Clipboard Image Saver"
 WINDOW_GEOMETRY = "720x420"
 MIN_WINDOW_SIZE = (640, 360)
 
 POLL_INTERVAL_SEC = 1.0
+# Re-read delay/attempts when another app has the clipboard open
+CLIPBOARD_RETRY_MS = 250
+CLIPBOARD_MAX_RETRIES = 8
 LOG_POLL_MS = 150
 MAX_FOLDER_HISTORY = 10
+MAX_LOG_LINES = 5000
+# zlib level for saved PNGs: 1 encodes several times faster than Pillow's
+# default 6 at the cost of somewhat larger files.
+PNG_COMPRESS_LEVEL = 1
+# "bmp" writes the clipboard DIB as-is (no encode, much larger files)
+SAVE_FORMATS = ("png", "bmp")
+DEFAULT_SAVE_FORMAT = "png"
 
 HISTORY_FILE = Path("folder_history.json")
 GOOGLE_SETTINGS_FILE = Path("google_sync.json")
+LOG_FILE = Path("clipboard_manager.log")
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUP_COUNT = 3
+DEBUG_ENV_VAR = "CLIPBOARD_MANAGER_DEBUG"
+
+
+def load_json(path: Path):
+    """Parse a JSON file straight from its bytes."""
+    return orjson.loads(path.read_bytes())
+
 
+def dump_json(path: Path, obj, indent: bool = False):
+    """Write obj as JSON in a single write to a temp file, then swap it in atomically."""
+    data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
 
-@dataclass
+
+@functools.lru_cache(maxsize=1)
+def _env_snapshot() -> tuple[str, str, str, str, str | None, str, str, str]:
+    """Read the Google sync env vars once; they are not expected to change at runtime."""
+    env = os.environ
+    return (
+        env.get("GOOGLE_APPLICATION_CREDENTIALS", ""),
+        env.get("GOOGLE_SPREADSHEET_ID", ""),
+        env.get("GOOGLE_SHEET_NAME", "Sheet1"),
+        env.get("GOOGLE_SEARCH_TERM", "add"),
+        env.get("GOOGLE_DRIVE_FOLDER_ID") or None,
+        env.get("GOOGLE_CLIENT_SECRET_JSON", ""),
+        env.get("GOOGLE_TOKEN_FILE", "google_token.json"),
+        env.get("GOOGLE_AUTH_MODE", "service"),
+    )
+
+
+@dataclass(frozen=True, slots=True)
 class GoogleSyncSettings:
     enabled: bool = False
     auth_mode: str = "service"  # "service" | "oauth"
@@ -30,14 +76,16 @@ class GoogleSyncSettings:
 
     @classmethod
     def from_env(cls) -> "GoogleSyncSettings":
-        creds = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
-        spreadsheet_id = os.getenv("GOOGLE_SPREADSHEET_ID", "")
-        sheet_name = os.getenv("GOOGLE_SHEET_NAME", "Sheet1")
-        search_term = os.getenv("GOOGLE_SEARCH_TERM", "add")
-        drive_folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID") or None
-        client_secret = os.getenv("GOOGLE_CLIENT_SECRET_JSON", "")
-        token_file = os.getenv("GOOGLE_TOKEN_FILE", "google_token.json")
-        auth_mode = os.getenv("GOOGLE_AUTH_MODE", "service")
+        (
+            creds,
+            spreadsheet_id,
+            sheet_name,
+            search_term,
+            drive_folder_id,
+            client_secret,
+            token_file,
+            auth_mode,
+        ) = _env_snapshot()
 
         enabled = bool(spreadsheet_id and ((auth_mode == "service" and creds) or (auth_mode == "oauth" and client_secret)))
         return cls(
@@ -54,16 +102,17 @@ class GoogleSyncSettings:
 
     @classmethod
     def from_dict(cls, data: dict) -> "GoogleSyncSettings":
+        get = data.get
         return cls(
-            enabled=bool(data.get("enabled", False)),
-            auth_mode=str(data.get("auth_mode", "service")),
-            credentials_file=str(data.get("credentials_file", "")),
-            client_secret_file=str(data.get("client_secret_file", "")),
-            token_file=str(data.get("token_file", "google_token.json")),
-            spreadsheet_id=str(data.get("spreadsheet_id", "")),
-            sheet_name=str(data.get("sheet_name", "Sheet1")),
-            search_term=str(data.get("search_term", "add")),
-            drive_folder_id=data.get("drive_folder_id") or None,
+            enabled=bool(get("enabled", False)),
+            auth_mode=str(get("auth_mode", "service")),
+            credentials_file=str(get("credentials_file", "")),
+            client_secret_file=str(get("client_secret_file", "")),
+            token_file=str(get("token_file", "google_token.json")),
+            spreadsheet_id=str(get("spreadsheet_id", "")),
+            sheet_name=str(get("sheet_name", "Sheet1")),
+            search_term=str(get("search_term", "add")),
+            drive_folder_id=get("drive_folder_id") or None,
         )
 
     @classmethod
@@ -71,9 +120,7 @@ class GoogleSyncSettings:
         target = path or GOOGLE_SETTINGS_FILE
         if target.exists():
             try:
-                with target.open("r", encoding="utf-8") as fh:
-                    data = json.load(fh)
-                return cls.from_dict(data)
+                return cls.from_dict(load_json(target))
             except Exception:
                 # fall back to env if file is malformed
                 pass
@@ -93,8 +140,5 @@ class GoogleSyncSettings:
         }
 
     def save(self, path: Path | None = None):
-        target = path or GOOGLE_SETTINGS_FILE
-        target.parent.mkdir(parents=True, exist_ok=True)
-        with target.open("w", encoding="utf-8") as fh:
-            json.dump(self.to_dict(), fh, ensure_ascii=False, indent=2)
+        dump_json(path or GOOGLE_SETTINGS_FILE, self.to_dict(), indent=True)
 
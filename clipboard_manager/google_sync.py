@@ -1,25 +1,70 @@
 from __future__ import annotations
 
-import io
+import logging
+import mimetypes
+import re
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials as UserCredentials
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from google_auth_oauthlib.flow import InstalledAppFlow
+from typing import TYPE_CHECKING, Callable, Optional
 
 from clipboard_manager.config import GoogleSyncSettings
 
+# The Google client libraries are imported where they are used: they are a
+# large import graph and most sessions never enable sync.
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials as UserCredentials
+    from google.oauth2.service_account import Credentials
+
+logger = logging.getLogger(__name__)
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive.file",
 ]
 
+# Retries (with exponential backoff) for transient API errors
+NUM_RETRIES = 3
+# Files larger than this are sent as a resumable upload in chunks of this size
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+# Cell updates queued within this window go out in one values.batchUpdate
+FLUSH_DELAY_SEC = 0.5
+
+# (auth_mode, credentials_file, client_secret_file, token_file) -> (creds, http, sheets, drive).
+# Settings changes that keep the same credentials reuse the loaded key and built clients.
+# Entries are dropped when the credentials stop working, so they are rebuilt on next use.
+_CLIENT_CACHE: dict[tuple[str, str, str, str], tuple] = {}
+# Same key -> the lock serializing use of those clients. httplib2.Http is not
+# thread-safe, and an old and a new GoogleSheetSync can share one during a
+# settings change. Kept across evictions so both keep agreeing on the lock.
+_CLIENT_LOCKS: dict[tuple[str, str, str, str], threading.RLock] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+# (client key, drive folder id) -> whether the folder already grants public read
+_FOLDER_PUBLIC: dict[tuple[tuple[str, str, str, str], str], bool] = {}
+
+
+def _col_letters(col: int) -> str:
+    """Convert a 1-based column number to its letters (1 -> A, 27 -> AA)."""
+    letters = []
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters.append(chr(65 + rem))
+    return "".join(reversed(letters))
+
+
+# Column letters for A..ZZ; wider columns fall back to _col_letters
+_A1_COLS = tuple(_col_letters(i) for i in range(1, 703))
+
+
+def _is_auth_error(exc: Exception) -> bool:
+    """True if exc means the credentials were revoked, expired for good, or replaced."""
+    from google.auth.exceptions import RefreshError
+    from googleapiclient.errors import HttpError
+
+    if isinstance(exc, RefreshError):
+        return True
+    return isinstance(exc, HttpError) and exc.resp.status == 401
+
 
 @dataclass
 class GoogleSyncResult:
@@ -29,13 +74,75 @@ class GoogleSyncResult:
 
 
 class GoogleSheetSync:
-    def __init__(self, settings: GoogleSyncSettings):
+    def __init__(self, settings: GoogleSyncSettings, log: Callable[[str, int], None] | None = None):
         if not settings.enabled:
             raise ValueError("Google sync is disabled (missing env vars).")
         self.settings = settings
-        self.creds = self._load_credentials()
-        self.sheets = build("sheets", "v4", credentials=self.creds, cache_discovery=False).spreadsheets()
-        self.drive = build("drive", "v3", credentials=self.creds, cache_discovery=False)
+        # Reports from the background flush, which has no caller to raise to;
+        # called as log(msg, level)
+        self._log = log or (lambda msg, level: logger.log(level, msg))
+        # Settings are frozen, so derive the search helpers once
+        self._search_term_lower = settings.search_term.casefold()
+        self._search = re.compile(re.escape(settings.search_term), re.IGNORECASE).search
+        # Matching cells from the last full scan, in scan order, keyed by
+        # (spreadsheet, sheet, term); consumed as images are placed.
+        self._cell_cache: dict[tuple[str, str, str], list[str]] = {}
+        self._client_key = (
+            (settings.auth_mode or "service").lower(),
+            settings.credentials_file,
+            settings.client_secret_file,
+            settings.token_file,
+        )
+        with _CLIENT_CACHE_LOCK:
+            # Guards the shared API clients and this instance's pending queue
+            # (flushes run on a timer thread)
+            self._lock = _CLIENT_LOCKS.setdefault(self._client_key, threading.RLock())
+        self._pending_updates: list[dict] = []
+        self._flush_timer: threading.Timer | None = None
+        self._clients = self._get_clients()
+        self.creds, self.http, self.sheets, self.drive = self._clients
+
+    def _get_clients(self) -> tuple:
+        # Built under the per-key lock, not the global cache lock: OAuth
+        # sign-in waits on the browser, and only one flow (and one token_file
+        # write) may run for the same credentials.
+        with self._lock:
+            with _CLIENT_CACHE_LOCK:
+                clients = _CLIENT_CACHE.get(self._client_key)
+            if clients is None:
+                clients = self._build_clients()
+                with _CLIENT_CACHE_LOCK:
+                    _CLIENT_CACHE[self._client_key] = clients
+        return clients
+
+    def _ensure_clients(self):
+        """Rebuild the clients if they were dropped after an auth failure."""
+        if self._clients is None:
+            self._clients = self._get_clients()
+            self.creds, self.http, self.sheets, self.drive = self._clients
+
+    def _drop_clients(self):
+        """Forget clients whose credentials stopped working (revoked token, replaced key)."""
+        if self._clients is None:
+            return
+        with _CLIENT_CACHE_LOCK:
+            if _CLIENT_CACHE.get(self._client_key) is self._clients:
+                del _CLIENT_CACHE[self._client_key]
+        self._clients = None
+
+    def _build_clients(self) -> tuple:
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+        from googleapiclient.http import build_http
+
+        creds = self._load_credentials()
+        # One authorized keep-alive connection pool shared by both clients, so
+        # uploads after the first skip the TLS handshake. build_http() keeps the
+        # client's socket timeout and its handling of 308 resumable-upload replies.
+        http = AuthorizedHttp(creds, http=build_http())
+        sheets = build("sheets", "v4", http=http, cache_discovery=False).spreadsheets()
+        drive = build("drive", "v3", http=http, cache_discovery=False)
+        return creds, http, sheets, drive
 
     def _load_credentials(self):
         mode = (self.settings.auth_mode or "service").lower()
@@ -48,6 +155,8 @@ class GoogleSheetSync:
     def _load_service_credentials(self, path: Path) -> Credentials:
         if not path.exists():
             raise FileNotFoundError(f"Google credentials file not found: {path}")
+        from google.oauth2.service_account import Credentials
+
         return Credentials.from_service_account_file(str(path), scopes=SCOPES)
 
     def _load_user_credentials(self) -> UserCredentials:
@@ -56,6 +165,10 @@ class GoogleSheetSync:
         if not secret_path.exists():
             raise FileNotFoundError(f"OAuth client secret file not found: {secret_path}")
 
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials as UserCredentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
         creds: UserCredentials | None = None
         if token_path.exists():
             creds = UserCredentials.from_authorized_user_file(str(token_path), SCOPES)
@@ -71,23 +184,84 @@ class GoogleSheetSync:
         return creds
 
     def upload_and_update(self, image_path: Path) -> GoogleSyncResult:
-        file_id = self._upload_to_drive(image_path)
-        link = f"https://drive.google.com/uc?export=view&id={file_id}"
-        cell = self._find_target_cell()
-        if cell is None:
-            raise RuntimeError(f"No cell containing '{self.settings.search_term}' found in sheet {self.settings.sheet_name}")
-        self._update_cell_with_image(cell, link)
+        """
+        Upload the image and queue its IMAGE() formula for the target cell.
+        The sheet write happens on the next flush (FLUSH_DELAY_SEC later, or flush()),
+        which reports its outcome through the log callback.
+        """
+        with self._lock:
+            self._ensure_clients()
+            try:
+                file_id = self._upload_to_drive(image_path)
+                link = f"https://drive.google.com/uc?export=view&id={file_id}"
+                cell = self._find_target_cell()
+            except Exception as exc:
+                if _is_auth_error(exc):
+                    self._drop_clients()
+                raise
+            if cell is None:
+                raise RuntimeError(f"No cell containing '{self.settings.search_term}' found in sheet {self.settings.sheet_name}")
+            self._queue_cell_update(cell, link)
+            self._mark_cell_used(cell)
         return GoogleSyncResult(cell=cell, file_id=file_id, link=link)
 
+    def flush(self):
+        """Write all queued cell updates in a single values.batchUpdate."""
+        from googleapiclient.errors import HttpError
+
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_updates:
+                return
+            self._ensure_clients()
+            batch = self._pending_updates
+            cells = ", ".join(update["range"] for update in batch)
+            try:
+                self.sheets.values().batchUpdate(
+                    spreadsheetId=self.settings.spreadsheet_id,
+                    body={"valueInputOption": "USER_ENTERED", "data": batch},
+                ).execute(num_retries=NUM_RETRIES)
+            except Exception as exc:
+                if _is_auth_error(exc):
+                    # Keep the updates for the rebuilt clients
+                    self._drop_clients()
+                    raise
+                if not isinstance(exc, HttpError) or not 400 <= exc.resp.status < 500 or exc.resp.status == 429:
+                    raise
+                # A rejected request (e.g. renamed sheet) fails the same way on
+                # every retry; drop it so later updates are not stuck behind it.
+                self._pending_updates = []
+                self._log(f"Sheets rejected the update for {cells}; dropped it: {exc}", logging.ERROR)
+                return
+            self._pending_updates = []
+        self._log(f"Sheets updated: {cells}", logging.DEBUG)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            # Updates stay queued and go out with the next flush
+            self._log(f"Google Sheets batch update failed (will retry): {exc}", logging.WARNING)
+
     def _upload_to_drive(self, image_path: Path) -> str:
+        from googleapiclient.http import MediaFileUpload
+
         file_metadata = {
             "name": image_path.name,
         }
         if self.settings.drive_folder_id:
             file_metadata["parents"] = [self.settings.drive_folder_id]
 
-        with image_path.open("rb") as fh:
-            media = MediaIoBaseUpload(io.BytesIO(fh.read()), mimetype="image/png")
+        # Stream from disk instead of reading the whole file into memory first
+        resumable = image_path.stat().st_size > UPLOAD_CHUNK_SIZE
+        media = MediaFileUpload(
+            str(image_path),
+            mimetype=mimetypes.guess_type(image_path.name)[0] or "image/png",
+            chunksize=UPLOAD_CHUNK_SIZE,
+            resumable=resumable,
+        )
         created = (
             self.drive.files()
             .create(
@@ -96,10 +270,14 @@ class GoogleSheetSync:
                 fields="id",
                 supportsAllDrives=True,
             )
-            .execute()
+            .execute(num_retries=NUM_RETRIES)
         )
         file_id = created["id"]
 
+        if self._is_folder_public():
+            # Inherits public read access from the folder
+            return file_id
+
         # Make it readable if it's not under a shared folder
         try:
             self.drive.permissions().create(
@@ -107,46 +285,109 @@ class GoogleSheetSync:
                 body={"role": "reader", "type": "anyone"},
                 fields="id",
                 supportsAllDrives=True,
-            ).execute()
+            ).execute(num_retries=NUM_RETRIES)
         except Exception:
             # If permission fails (e.g., folder already shares), continue
             pass
         return file_id
 
+    def _is_folder_public(self) -> bool:
+        """
+        Whether the Drive folder already grants public read access.
+        Checked on first upload (callers hold self._lock) and remembered per
+        credentials and folder, so settings changes do not repeat the call.
+        """
+        folder_id = self.settings.drive_folder_id
+        if not folder_id:
+            return False
+        key = (self._client_key, folder_id)
+        with _CLIENT_CACHE_LOCK:
+            cached = _FOLDER_PUBLIC.get(key)
+        if cached is not None:
+            return cached
+        try:
+            resp = (
+                self.drive.permissions()
+                .list(
+                    fileId=folder_id,
+                    fields="permissions(type,role)",
+                    supportsAllDrives=True,
+                )
+                .execute(num_retries=NUM_RETRIES)
+            )
+        except Exception:
+            # Can't tell (e.g. no permission to list); share per file and ask again next time
+            return False
+        is_public = any(
+            perm.get("type") == "anyone" and perm.get("role") in ("reader", "writer")
+            for perm in resp.get("permissions", [])
+        )
+        with _CLIENT_CACHE_LOCK:
+            _FOLDER_PUBLIC[key] = is_public
+        return is_public
+
+    def _cell_cache_key(self) -> tuple[str, str, str]:
+        return (self.settings.spreadsheet_id, self.settings.sheet_name, self._search_term_lower)
+
     def _find_target_cell(self) -> Optional[str]:
+        key = self._cell_cache_key()
+        cached = self._cell_cache.get(key)
+        # Re-check the next remembered cell with a one-cell read before
+        # falling back to a full scan; the sheet may have been edited.
+        if cached and self._cell_contains_term(cached[0]):
+            return cached[0]
+
+        # Queued cells still contain the term on the sheet; write them first
+        self.flush()
+        cells = self._scan_target_cells()
+        self._cell_cache[key] = cells
+        return cells[0] if cells else None
+
+    def _scan_target_cells(self) -> list[str]:
         # Fetch a reasonable range; adjust if larger sheets are expected
         range_ref = f"{self.settings.sheet_name}!A1:Z200"
         resp = (
             self.sheets.values()
             .get(spreadsheetId=self.settings.spreadsheet_id, range=range_ref)
-            .execute()
+            .execute(num_retries=NUM_RETRIES)
         )
         values = resp.get("values", [])
-        search = self.settings.search_term.lower()
+        # Case-insensitive search without lowercasing every cell
+        matcher = self._search
 
+        cells = []
         for r_idx, row in enumerate(values, start=1):
             for c_idx, value in enumerate(row, start=1):
-                if isinstance(value, str) and search in value.lower():
-                    return f"{self.settings.sheet_name}!{self._a1(c_idx, r_idx)}"
-        return None
-
-    def _update_cell_with_image(self, cell_ref: str, link: str):
-        body = {"values": [[f'=IMAGE("{link}")']]}
-        self.sheets.values().update(
-            spreadsheetId=self.settings.spreadsheet_id,
-            range=cell_ref,
-            valueInputOption="USER_ENTERED",
-            body=body,
-        ).execute()
+                if isinstance(value, str) and matcher(value) is not None:
+                    cells.append(f"{self.settings.sheet_name}!{self._a1(c_idx, r_idx)}")
+        return cells
+
+    def _cell_contains_term(self, cell_ref: str) -> bool:
+        resp = (
+            self.sheets.values()
+            .get(spreadsheetId=self.settings.spreadsheet_id, range=cell_ref)
+            .execute(num_retries=NUM_RETRIES)
+        )
+        values = resp.get("values", [])
+        value = values[0][0] if values and values[0] else ""
+        return isinstance(value, str) and self._search(value) is not None
+
+    def _mark_cell_used(self, cell_ref: str):
+        cached = self._cell_cache.get(self._cell_cache_key())
+        if cached and cached[0] == cell_ref:
+            cached.pop(0)
+
+    def _queue_cell_update(self, cell_ref: str, link: str):
+        self._pending_updates.append({"range": cell_ref, "values": [[f'=IMAGE("{link}")']]})
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(FLUSH_DELAY_SEC, self._flush_from_timer)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
 
     @staticmethod
     def _a1(col: int, row: int) -> str:
         """Convert 1-based column/row to A1 notation."""
-        letters = ""
-        x = col
-        while x:
-            x, rem = divmod(x - 1, 26)
-            letters = chr(65 + rem) + letters
+        letters = _A1_COLS[col - 1] if col <= len(_A1_COLS) else _col_letters(col)
         return f"{letters}{row}"
 
 